@@ -12,14 +12,6 @@ def id_parse(out):
         return None
 
     uid, user, gid, group, groups = match.groups()
-    ctx = {"uid": (int(uid), user), "gid": (int(gid), group), "groups": []}
-
-    groups = groups.split(",")
-    for group in groups:
-        match = _id_re_compiled.match(group)
-        if not match:
-            continue
-
-        gid, group = match.groups()
-        ctx["groups"].append((int(gid), group))
+    ctx = {"uid": (int(uid), user), "gid": (int(gid), group)}
+    ctx["groups"] = [(int(g), n) for g, n in _id_re_compiled.findall(groups)]
     return ctx
@@ -4,6 +4,8 @@ import shutil
 import random
 import json
 
+from stat import S_ISDIR, S_ISREG
+
 from tempfile import mkstemp
 from abstractshell.shells import Shell, LocalShell, RemoteShell
 from typing import List, Union, Optional
@@ -23,8 +25,10 @@ class AbstractPath:
     @staticmethod
     def from_string(path, shell: Shell):
         if shell.remote:
-            if not REMOTE_RE.match(path):
-                path = f"{shell.username}@{shell.hostname}:{path}"
+            if ":" not in path or not REMOTE_RE.match(path):
+                return RemotePath._from_parts(
+                    f"{shell.username}@", shell.hostname, path, shell
+                )
 
             return RemotePath(path, shell)
         return LocalPath(path)
@@ -174,6 +178,20 @@ class RemotePath(AbstractPath):
     def __repr__(self):
         return str(self)
 
+    @classmethod
+    def _from_parts(cls, user, host, local_path, shell: Shell) -> "RemotePath":
+        """
+        Builds a RemotePath from already-parsed components, skipping REMOTE_RE.
+        """
+        path = cls.__new__(cls)
+        AbstractPath.__init__(path, True)
+        path.user = user
+        path.host = host
+        path._local_path = local_path
+        path._shell = shell
+        path._stat_cache = None
+        return path
+
     def _host(self):
         string = ""
         if self.user:
@@ -199,19 +217,36 @@ class RemotePath(AbstractPath):
         self.user = user
         self.host = host
         self._local_path = local_path
+        self._stat_cache = None
 
     @property
     def local_path(self):
         return self._local_path
 
+    def dirname(self) -> "RemotePath":
+        return RemotePath._from_parts(
+            self.user, self.host, os.path.dirname(self._local_path), self._shell
+        )
+
+    def join(self, rel) -> "RemotePath":
+        return RemotePath._from_parts(
+            self.user, self.host, os.path.join(self._local_path, rel), self._shell
+        )
+
     def mkdir(self):
+        self._stat_cache = None
         self.shell.mkdir(self.local_path)
 
+    def _cached_stat(self) -> Optional[os.stat_result]:
+        return self._stat_cache or self.stat()
+
     def isfile(self) -> bool:
-        return self.shell.exec_statusonly(f"test -f {self.local_path}") == 0
+        st = self._cached_stat()
+        return st is not None and S_ISREG(st.st_mode)
 
     def isdir(self) -> bool:
-        return self.shell.exec_statusonly(f"test -d {self.local_path}") == 0
+        st = self._cached_stat()
+        return st is not None and S_ISDIR(st.st_mode)
 
     def listdir(self) -> List[str]:
         (_i, dirlist, _e) = self.shell.exec(f"ls -1 {self.local_path}")
@@ -228,6 +263,7 @@ class RemotePath(AbstractPath):
         os.write(fd, contents.encode())
         os.close(fd)
 
+        self._stat_cache = None
         rsync = RsyncBase(LocalShell(), self.shell, progress_bar=False)
 
         ret = rsync.transfer_file(AbstractPath.from_string(name, LocalShell()), self)
@@ -238,6 +274,8 @@ class RemotePath(AbstractPath):
         if isinstance(path, str):
             path = RemotePath(path, self.shell)
 
+        self._stat_cache = None
+        path._stat_cache = None
         return (
             self.shell.exec_statusonly(f"mv {self.local_path} {path.local_path}") == 0
         )
@@ -255,6 +293,7 @@ class RemotePath(AbstractPath):
             dest_shell = LocalShell()
         elif isinstance(path, RemotePath):
             dest_shell = path.shell
+            path._stat_cache = None
 
         rsync = RsyncBase(src_shell, dest_shell)
         if self.isdir():
@@ -263,24 +302,25 @@ class RemotePath(AbstractPath):
             return rsync.transfer_file(self, path)
 
     def unlink(self):
+        self._stat_cache = None
         self.shell.exec_statusonly(f"rm -r {self.local_path}") == 0
 
     def stat(self) -> os.stat_result:
+        # -L follows symlinks, matching os.stat() and the old "test -f/-d" checks,
+        # so filesize() of a symlink is the size of its target.
         (_i, o, _e) = self.shell.exec(
-            f'stat -c "%f %i %d %h %u %g %s %X %Y %Z" {self.local_path}'
+            f'stat -L -c "%f %i %d %h %u %g %s %X %Y %Z" {self.local_path}'
         )
         info = o.read().decode()
         if o.wait_exit_status() > 0:
+            self._stat_cache = None
             return None
 
-        seq = re.split(r"\s+", info)
-        seq = [s for s in seq if s]
-
-        seq[0] = int(seq[0], 16)
-        for i in range(1, len(seq)):
-            seq[i] = int(seq[i])
-
-        return os.stat_result(sequence=seq)
+        st_mode, *rest = info.split()
+        self._stat_cache = os.stat_result(
+            sequence=(int(st_mode, 16), *map(int, rest))
+        )
+        return self._stat_cache
 
     def uses_shell(self, sh: Shell) -> bool:
         if isinstance(sh, LocalShell):
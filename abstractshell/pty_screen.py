@@ -1,11 +1,9 @@
 import pyte
-import io
 import time
 import select
 import os
 
 from enum import Enum
-from functools import partial
 
 
 class PtyConstants(Enum):
@@ -18,36 +16,32 @@ NO_LINE = PtyConstants.NO_LINE
 class TextBufferScreen(pyte.Screen):
     def __init__(self, debug=False):
         super().__init__(80, 25)
-        self.buffer = io.StringIO()
+        # pyte.Screen.__init__ calls reset(), which is stubbed out below.
+        pyte.Screen.reset(self)
+        self._chunks = []
         self.title = ""
         self._debug = debug
 
-        for fn in cursor_functions:
-            setattr(self, fn, partial(generic_cursor_control, self))
-        for fn in functions:
-            setattr(self, fn, partial(generic_fn, self))
-
     def debug(self, *args, **kwargs):
         if self._debug:
             print("debug function:", args, kwargs)
 
-        self.buffer.write("\r\n")
+        self._chunks.append("\r\n")
         pass
 
     def draw(self, text, *args, **kwargs):
-        self.buffer.write(text)
+        self._chunks.append(text)
         if self._debug:
             print(f"drawing '{text}'")
 
     def readbuffer(self):
-        val = self.buffer.getvalue()
-        self.buffer = io.StringIO()
+        val = "".join(self._chunks)
+        self._chunks.clear()
         return val
 
     def erase_in_display(self, how=0, *args, **kwargs):
         if how >= 2:
-            self.buffer.close()
-            self.buffer = io.StringIO()
+            self._chunks.clear()
 
         elif how == 0:
             if self._debug:
@@ -60,12 +54,12 @@ class TextBufferScreen(pyte.Screen):
                 print("HOW NOT SUPPORT", how, args, kwargs)
 
     def carriage_return(self):
-        self.buffer.write("\r")
+        self._chunks.append("\r")
         if self._debug:
             print("CR")
 
     def linefeed(self):
-        self.buffer.write("\n")
+        self._chunks.append("\n")
         if self._debug:
             print("LF")
 
@@ -75,17 +69,17 @@ class TextBufferScreen(pyte.Screen):
             print("set_title", title)
 
     def backspace(self):
-        self.buffer.write("\b")
+        self._chunks.append("\b")
         if self._debug:
             print("backspace char")
 
     def tab(self):
-        self.buffer.write("\t")
+        self._chunks.append("\t")
         if self._debug:
             print("tab char")
 
 
-def generic_cursor_control(*args, **kwargs):
+def generic_cursor_control(self, *args, **kwargs):
     pass
 
 
@@ -135,3 +129,8 @@ functions = [
     "set_alternate_keypad",
     "set_number_keypad",
 ]
+
+for fn in cursor_functions:
+    setattr(TextBufferScreen, fn, generic_cursor_control)
+for fn in functions:
+    setattr(TextBufferScreen, fn, generic_fn)
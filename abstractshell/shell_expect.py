@@ -1,8 +1,9 @@
 import re
 import io
 import sys
+import functools
 
-from typing import Union, Tuple, Iterable
+from typing import Optional, Union, Tuple, Iterable
 
 from enum import Enum
 from collections.abc import Iterable
@@ -22,7 +23,47 @@ class SpecialConstants(Enum):
 
 
 EOF = SpecialConstants.EOF
-PROMPT = r"(\(.*\)\s+)?\[.*\][\$\#]\s+"
+PROMPT = re.compile(r"(\(.*\)\s+)?\[.*\][\$\#]\s+")
+
+# Upper bound on a single read from the PTY or SSH channel.
+_READ_SIZE = 65536
+# Seconds the expect loop waits for output before handing back an empty read.
+_READ_WAIT = 0.05
+
+# Characters that pyte handles as anything other than plain text. CR and LF
+# are left out since TextBufferScreen writes them through unchanged.
+_CONTROL_RE = re.compile("[\x00\x07\x08\x09\x0b\x0c\x0e\x0f\x1b\x7f\x9b\x9d]")
+
+# Starts of escape sequences, and complete sequences from such a start, as
+# pyte.Stream parses them: ESC plus a final character (two after # % ( or )),
+# CSI up to its final character, and OSC up to BEL or ST.
+_ESCAPE_START_RE = re.compile("[\x1b\x9b\x9d]")
+_ESCAPE_RE = re.compile(
+    r"\x1b[#%()].|\x1b[^\[\]#%()]"
+    r"|(?:\x1b\[|\x9b)[?\d; >\x07-\x0d]*(?:\$.|[^?\d; >$\x07-\x0d])"
+    r"|(?:\x1b\]|\x9d)(?:[RP]|.(?:[^\x07\x1b\x9c]|\x1b[^\\])*(?:[\x07\x9c]|\x1b\\))",
+    re.DOTALL,
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(pattern):
+    return re.compile(pattern)
+
+
+def _open_escape(text):
+    """
+    Returns the escape sequence left unfinished at the end of text, or None.
+    """
+    pos = 0
+    while True:
+        start = _ESCAPE_START_RE.search(text, pos)
+        if not start:
+            return None
+        match = _ESCAPE_RE.match(text, start.start())
+        if not match:
+            return text[start.start() :]
+        pos = match.end()
 
 
 class ShellExpectEOF(Exception):
@@ -55,8 +96,20 @@ class LineIterator:
         return buf
 
     def next_line(self, match_re=None):
+        patterns = [
+            (j, r_ex)
+            for (j, r_ex) in enumerate(match_re or ())
+            if not isinstance(r_ex, SpecialConstants)
+        ]
+        return self._next_line(patterns)
+
+    def _next_line(self, patterns):
+        """
+        patterns: (index, compiled regex) pairs, tried in order against the line.
+        """
         while not self.buffer:
-            buf = self.interaction._read_pty()
+            # Block in select/recv rather than spin while the process is quiet.
+            buf = self.interaction._read_pty(_READ_WAIT)
             if buf is SpecialConstants.EOF and not self.buffer:
                 return SpecialConstants.EOF
 
@@ -64,38 +117,24 @@ class LineIterator:
                 self.buffer += buf
             if not self.buffer:
                 return SpecialConstants.NO_LINE
-        found_match = None
+        # A line runs up to and including the first "\n". Patterns are tried
+        # once against the line, excluding the "\n" of a "\r\n" terminator.
+        nl = self.buffer.find("\n")
+        if nl == -1:
+            i = end = len(self.buffer)
+        else:
+            i = nl + 1
+            end = nl if nl > 0 and self.buffer[nl - 1] == "\r" else i
 
-        i = 0
-        while i < len(self.buffer):
-            if match_re:
-                to_match = self.buffer[0 : i + 1]
-                for (j, r_ex) in enumerate(match_re):
-                    if isinstance(r_ex, SpecialConstants):
-                        continue
-
-                    match = r_ex.match(to_match)
-                    if match:
-                        found_match = (r_ex, j, to_match, match)
-                        break
-
-            if (
-                i + 1 < len(self.buffer)
-                and self.buffer[i] == "\r"
-                and self.buffer[i + 1] == "\n"
-            ):
-                i += 2
-                break
-            if self.buffer[i] == "\n":
-                i += 1
-                break
+        line = self.buffer[0:i]
 
-            i += 1
-            if found_match and i >= len(self.buffer):
+        found_match = None
+        for (j, r_ex) in patterns:
+            match = r_ex.match(self.buffer, 0, end)
+            if match:
+                found_match = (r_ex, j, self.buffer[0:end], match)
                 break
 
-        line = self.buffer[0:i]
-
         if i == len(self.buffer):
             self.buffer = ""
         else:
@@ -144,6 +183,8 @@ class PtyShellExpect:
 
         self.screen = TextBufferScreen()
         self.stream = pyte.Stream(self.screen)
+        # Unfinished escape sequence at the end of the output fed so far.
+        self._escape_tail = None
         self.line_itr = LineIterator(self, self.stream, self.screen)
 
         self.buffer_idx = 0
@@ -179,8 +220,7 @@ class PtyShellExpect:
                 break
 
             if len(buf) > 0:
-                self.stream.feed(buf.decode())
-                printfn(self.screen.readbuffer())
+                printfn(self._feed_screen(buf.decode()))
 
         if not self.ptyproc.closed:
             self.ptyproc.close()
@@ -189,11 +229,11 @@ class PtyShellExpect:
     def _write(self, data, flush=False):
         return self.ptyproc.write(data, flush=flush)
 
-    def _read(self, n=1024):
+    def _read(self, n=_READ_SIZE, timeout=0):
         if self.ptyproc.fd < 0:
             return SpecialConstants.EOF
 
-        (rlist, wlist, xlist) = select.select([self.ptyproc.fd], [], [], 0)
+        (rlist, wlist, xlist) = select.select([self.ptyproc.fd], [], [], timeout)
         if rlist:
             try:
                 return os.read(self.ptyproc.fd, n)
@@ -218,43 +258,71 @@ class PtyShellExpect:
 
     def _read_pty_raw(self, timeout=0):
         """
-        Returns whatever is in the proc fd buffer.
+        Returns whatever is in the proc fd buffer, waiting up to timeout seconds
+        for the first of it to arrive.
         """
-        buf = b""
+        buf = bytearray()
         while self._continue_read():
-            b = self._read(1024)
+            b = self._read(_READ_SIZE, timeout)
+            timeout = 0
             if b is SpecialConstants.EOF:
                 if len(buf) == 0:
                     return SpecialConstants.EOF
                 else:
-                    return buf
+                    return bytes(buf)
             if len(b) == 0:
-                return buf
+                return bytes(buf)
 
-            buf += b
+            buf.extend(b)
+            # A short read means the fd is drained for now; skip the extra select.
+            if len(b) < _READ_SIZE:
+                return bytes(buf)
 
         if not self._continue_read() and len(buf) == 0:
             return SpecialConstants.EOF
 
-        return buf
+        return bytes(buf)
 
-    def _read_pty(self):
-        buf = self._read_pty_raw()
+    def _read_pty(self, timeout=0):
+        buf = self._read_pty_raw(timeout)
         if buf is SpecialConstants.EOF:
             return SpecialConstants.EOF
 
         if len(buf) == 0:
             return ""
 
-        self.stream.feed(buf.decode())
+        return self._feed_screen(buf.decode())
 
-        text = self.screen.readbuffer()
-        return text
+    def _feed_screen(self, text):
+        """
+        Runs decoded output through the screen and returns the rendered text.
+        Plain text skips pyte's parser unless it is in the middle of a sequence.
+        """
+        if self._escape_tail is None and not _CONTROL_RE.search(text):
+            self.screen.draw(text)
+        else:
+            self.stream.feed(text)
+            self._escape_tail = _open_escape((self._escape_tail or "") + text)
+
+        return self.screen.readbuffer()
 
     def expect(self, regex, echo=True, printfn=None):
         (res, i) = self.expect_match(regex, echo, printfn) or (None, None)
         return i
 
+    def try_expect(self, regex, echo=True, printfn=None) -> Optional[int]:
+        """
+        Like expect, but returns None at EOF rather than raising ShellExpectEOF,
+        for callers to whom EOF is an ordinary outcome.
+        """
+        if not isinstance(regex, Iterable) or isinstance(regex, str):
+            regex = [regex]
+
+        (res, i) = self.expect_match([*regex, SpecialConstants.EOF], echo, printfn)
+        if res is SpecialConstants.EOF:
+            return None
+        return i
+
     def expect_match(
         self, regex, echo=True, printfn=None
     ) -> Union[Tuple[re.compile, int], SpecialConstants]:
@@ -264,16 +332,20 @@ class PtyShellExpect:
         if not isinstance(regex, Iterable) or isinstance(regex, str):
             regex = [regex]
 
-        for (i, r) in enumerate(regex):
-            if isinstance(r, str):
-                regex[i] = re.compile(r)
+        regex = tuple(_compile(r) if isinstance(r, str) else r for r in regex)
+        patterns = [
+            (i, r) for (i, r) in enumerate(regex) if not isinstance(r, SpecialConstants)
+        ]
+        eof_idx = next(
+            (i for (i, r) in enumerate(regex) if r is SpecialConstants.EOF), -1
+        )
 
         self.current_output_lines = []
 
         while True:
             itr = self.line_itr
 
-            res = itr.next_line(match_re=regex)
+            res = itr._next_line(patterns)
             if res is not SpecialConstants.NO_LINE:
                 self.line_history.append(res)
 
@@ -289,11 +361,25 @@ class PtyShellExpect:
 
             if isinstance(res, SpecialConstants):
                 if res == SpecialConstants.EOF:
-                    if SpecialConstants.EOF not in regex:
+                    if eof_idx < 0:
                         raise ShellExpectEOF()
-                    return SpecialConstants.EOF, regex.index(SpecialConstants.EOF)
+                    return SpecialConstants.EOF, eof_idx
         return None
 
+    def expect_union(self, union, echo=True, printfn=None):
+        """
+        Expects a single pattern whose top-level alternatives are named groups,
+        so each line is scanned once however many alternatives there are.
+        Returns (match, name of the alternative that matched), or
+        (SpecialConstants.EOF, None) at EOF.
+        """
+        (match, _i) = self.expect_match(
+            (SpecialConstants.EOF, union), echo=echo, printfn=printfn
+        )
+        if match is SpecialConstants.EOF:
+            return (match, None)
+        return (match, match.lastgroup)
+
 
 class RemotePtyShellExpect(PtyShellExpect):
     def __init__(self, stdin, stdout, echo=True):
@@ -309,33 +395,21 @@ class RemotePtyShellExpect(PtyShellExpect):
     def _continue_read(self):
         return not self.chan.exit_status_ready()
 
-    # ChannelFile.read() has different behavior than conventional files.
-    # So we need to read one byte at a time, until socket.timeout
-    def _read1byte(self):
+    # Read straight from the channel rather than through ChannelFile, whose
+    # read() only returns once n bytes (or EOF) have arrived.
+    def _read(self, n=_READ_SIZE, timeout=0):
+        self.chan.settimeout(timeout)
         try:
-            b = self.stdout.read(1)
-            if len(b) == 0:
-                return SpecialConstants.EOF
-            else:
-                return b
+            data = self.chan.recv(n)
         except socket.timeout:
             return b""
+        finally:
+            # Writes go through the same channel and must not block.
+            self.chan.settimeout(0.0)
 
-    def _read(self, n=1024):
-        buf = b""
-
-        while n > 0:
-            b = self._read1byte()
-            if b is SpecialConstants.EOF:
-                if len(buf) == 0:
-                    return SpecialConstants.EOF
-                return buf
-            if len(b) == 0:
-                return buf
-            buf += b
-            n -= 1
-
-        return buf
+        if len(data) == 0:
+            return SpecialConstants.EOF
+        return data
 
     def _write(self, data, flush=False):
         try:
@@ -353,8 +427,7 @@ class RemotePtyShellExpect(PtyShellExpect):
         while not self.chan.exit_status_ready():
             buf = self._read_pty_raw(0.01)
             if isinstance(buf, (bytes, str)) and len(buf) > 0:
-                self.stream.feed(buf.decode())
-                printfn(self.screen.readbuffer())
+                printfn(self._feed_screen(buf.decode()))
             if buf is SpecialConstants.EOF:
                 break
 
@@ -1,10 +1,13 @@
 import subprocess
 import os
+import io
 import re
+import shlex
+import time
 
-from typing import Tuple
+from typing import List, Optional, Tuple, Union
 
-from abstractshell.ssh import WrappedSSHClient
+from abstractshell.ssh import WrappedSSHClient, is_transient_error
 from abstractshell.shell_expect import PtyShellExpect, RemotePtyShellExpect
 from abstractshell import id as id_cmd
 
@@ -14,6 +17,59 @@ from pexpect.utils import split_command_line
 
 logger = logging.getLogger("shells")
 
+# Characters that need /bin/sh to interpret. Commands without any of them are
+# executed directly, saving the intermediate shell process.
+_SHELL_META = re.compile(r"[|&;<>$`\\*?()\[\]{}~#=!\n]")
+
+
+# Arguments for LocalShell.exec and LocalShell.exec_capture respectively. Pipes
+# keep the default full buffering (bufsize=-1).
+_POPEN_KW = {
+    "stdin": subprocess.PIPE,
+    "stdout": subprocess.PIPE,
+    "stderr": subprocess.PIPE,
+}
+_RUN_KW = {"stdin": subprocess.DEVNULL, "capture_output": True}
+
+
+def _split_command(command: str):
+    """
+    Returns command as an argv list, or None if it needs a shell.
+    """
+    if _SHELL_META.search(command):
+        return None
+    try:
+        return shlex.split(command) or None
+    except ValueError:
+        return None
+
+
+def _quote_path(path: str) -> str:
+    """
+    Quotes path for the shell, leaving a leading ~/ unquoted so it still
+    expands to the home directory.
+    """
+    if path == "~":
+        return path
+    if path.startswith("~/"):
+        return "~/" + shlex.quote(path[2:])
+    return shlex.quote(path)
+
+
+def _spawn(run, command: str, **kwargs):
+    """
+    Calls run (subprocess.Popen or subprocess.run) with an argv list when
+    possible, otherwise through the shell.
+    """
+    argv = _split_command(command)
+    if argv:
+        try:
+            return run(argv, **kwargs)
+        except OSError:
+            # Not an executable (a builtin, or missing); let /bin/sh report it.
+            pass
+    return run(command, shell=True, **kwargs)
+
 
 class ShellIO:
     def __init__(self):
@@ -25,26 +81,59 @@ class LocalShellIO(ShellIO):
         super().__init__()
         self.process = proc
         self._io_attr = io_attr
+        self._buffer = None
+
+    def _communicate(self):
+        """
+        Drains the process with communicate() the first time any of its
+        LocalShellIO objects needs output or the exit status. The output is
+        kept on the Popen object so the stdin/stdout/stderr wrappers share it.
+        """
+        output = getattr(self.process, "_shell_output", None)
+        if output is None:
+            (out, err) = self.process.communicate()
+            output = {"stdout": out, "stderr": err}
+            self.process._shell_output = output
+        return output
 
     def wait_exit_status(self):
-        self.process.wait()
+        self._communicate()
         return self.process.returncode
 
     def exit_status_ready(self):
-        return self.poll() is not None
+        return self.process.poll() is not None
 
     def _io(self):
-        io = getattr(self.process, self._io_attr)
-        return io
+        if self._io_attr == "stdin":
+            return self.process.stdin
+
+        if self._buffer is None:
+            self._buffer = io.BytesIO(self._communicate()[self._io_attr])
+        return self._buffer
 
     def readlines(self):
-        io = self._io()
-        for line in io.readlines():
+        for line in self._io().readlines():
             if isinstance(line, bytes):
                 line = line.decode()
 
             yield line
 
+    def read(self, *args):
+        return self._io().read(*args)
+
+    def readline(self, *args):
+        return self._io().readline(*args)
+
+    def write(self, data):
+        return self._io().write(data)
+
+    def flush(self):
+        return self._io().flush()
+
+    def close(self):
+        return self._io().close()
+
+    # Anything not forwarded explicitly above.
     def __getattr__(self, item):
         return getattr(self._io(), item)
 
@@ -56,13 +145,39 @@ class RemoteShellIO(ShellIO):
     def __init__(self, io):
         super().__init__()
         self._io = io
+        self.channel = io.channel
+        self._exit_status = None
 
     def wait_exit_status(self):
-        return self._io.channel.recv_exit_status()
+        """
+        Blocks until the command exits. Prefer this to polling exit_status_ready().
+        """
+        if self._exit_status is None:
+            self._exit_status = self.channel.recv_exit_status()
+        return self._exit_status
 
     def exit_status_ready(self):
-        return self._io.channel.exit_status_ready()
+        return self._exit_status is not None or self.channel.exit_status_ready()
+
+    def read(self, *args):
+        return self._io.read(*args)
+
+    def readline(self, *args):
+        return self._io.readline(*args)
 
+    def readlines(self, *args):
+        return self._io.readlines(*args)
+
+    def write(self, data):
+        return self._io.write(data)
+
+    def flush(self):
+        return self._io.flush()
+
+    def close(self):
+        return self._io.close()
+
+    # Anything not forwarded explicitly above.
     def __getattr__(self, item):
         return getattr(self._io, item)
 
@@ -71,8 +186,6 @@ class RemoteShellIO(ShellIO):
 
 
 class Shell:
-    _du_line = re.compile("(\d+)\s+(.+)")
-
     # FIXME: requires_sudo may not be necessary.
     # FIXME: ssh_keyfile may be redundant, or not a good plan.
     def __init__(self, remote=False, ssh_keyfile=None, requires_sudo=True):
@@ -94,18 +207,22 @@ class Shell:
         user = user or ""
 
         # requires_sudo here prevents a not-very-clear stack overflow from happening.
-        (_i, out, _err) = self.exec(f"id {user}", requires_sudo=False)
-        ctx = id_cmd.id_parse(out.read().decode())
+        (_status, out, _err) = self.exec_capture(f"id {user}", requires_sudo=False)
+        ctx = id_cmd.id_parse(out.decode())
         return ctx
 
     def chmod(self, perms: int, path):
         if isinstance(perms, int):
             perms = oct(perms)[2:]
 
-        (_stdin, stdout, _stderr) = self.exec("chmod {perms} {path}")
+        (_stdin, stdout, _stderr) = self.exec(f"chmod {perms} {_quote_path(path)}")
         return stdout.wait_exit_status() == 0
 
-    def interact(self, command: str) -> PtyShellExpect:
+    def interact(self, command: Union[str, List[str]]) -> PtyShellExpect:
+        """
+        command: A command line, or an argv list that is run without re-parsing
+            where the shell allows it.
+        """
         raise NotImplementedError("Each shell should implement its own shell expect.")
 
     def exec_statusonly(self, command: str) -> int:
@@ -117,9 +234,79 @@ class Shell:
             "exec not implemented in abstract Shell class, should have instantiated LocalShell or RemoteShell"
         )
 
+    def exec_capture(
+        self, command: str, requires_sudo=None
+    ) -> Tuple[int, bytes, bytes]:
+        """
+        Runs command to completion and returns (exit status, stdout, stderr).
+        """
+        (_stdin, stdout, stderr) = self.exec(command, requires_sudo=requires_sudo)
+        out = stdout.read()
+        err = stderr.read()
+        return (stdout.wait_exit_status(), out, err)
+
+    # Marks the end of each command's output in exec_many, followed by $?.
+    _EXEC_MANY_SEP = "__SHELLUTIL_EXIT_STATUS__"
+
+    def exec_many(
+        self, commands: List[str], requires_sudo=None
+    ) -> List[Tuple[int, bytes]]:
+        """
+        Runs commands one after another in a single exec (one SSH channel for
+        remote shells) and returns (exit status, stdout) for each of them.
+        Each command runs in its own subshell, so exit, exec, cd or set -e only
+        affect that command. stderr is not split per command.
+        """
+        if not commands:
+            return []
+
+        script = self._exec_many_script(
+            [self._prepare_command(cmd, requires_sudo) for cmd in commands]
+        )
+        (_status, out, _err) = self.exec_capture(script, requires_sudo=False)
+        return self._exec_many_results(out, len(commands))
+
+    def _exec_many_script(self, commands: List[str]) -> str:
+        # The newlines inside the parentheses keep a trailing comment in a
+        # command from swallowing the closing parenthesis.
+        return "; ".join(
+            f"(\n{cmd}\n); printf '\\n{self._EXEC_MANY_SEP}%d\\n' $?"
+            for cmd in commands
+        )
+
+    def _exec_many_results(self, out: bytes, count: int) -> List[Tuple[int, bytes]]:
+        results = []
+        chunks = out.split(f"\n{self._EXEC_MANY_SEP}".encode())
+        for (i, chunk) in enumerate(chunks[:-1]):
+            if i > 0:
+                # Drop the previous command's exit status line.
+                chunk = chunk.partition(b"\n")[2]
+            status = int(chunks[i + 1].partition(b"\n")[0])
+            results.append((status, chunk))
+
+        if len(results) != count:
+            raise RuntimeError(
+                f"exec_many expected {count} results, got {len(results)}"
+            )
+        return results
+
+    def _prepare_command(self, command: str, requires_sudo=None) -> str:
+        if requires_sudo is False:
+            return command
+        elif requires_sudo is True:
+            return self._sudoify(command, force_sudo=True)
+        return self._sudoify(command)
+
+    def _id_context(self):
+        """
+        Returns the id of the shell's user, used to decide whether to sudo.
+        Subclasses may cache this beyond a single Shell instance.
+        """
+        return self.id()
+
     def _sudoify(self, command: str, force_sudo=False):
         if not self._id_ctx:
-            self._id_ctx = self.id()
+            self._id_ctx = self._id_context()
         if not self._id_ctx:
             return command
 
@@ -130,68 +317,96 @@ class Shell:
         return command
 
     def mkdir(self, path):
-        (_stdin, stdout, stderr) = self.exec(f"mkdir -p {path}")
-        logger.info(
-            f"mkdir -p {path}: <%s> <%s>",
-            stdout.read().decode(),
-            stderr.read().decode(),
-        )
+        (status, out, err) = self.exec_capture(f"mkdir -p {_quote_path(path)}")
+        logger.info(f"mkdir -p {path}: <%s> <%s>", out.decode(), err.decode())
 
-        return stdout.wait_exit_status()
+        return status
 
     def dirsize(self, path):
-        (_i, out, err) = self.exec(f"du -sk {path}")
+        (_status, out, _err) = self.exec_capture(f"du -sk {path}")
 
-        for line in out.readlines():
-            match = self._du_line.match(line)
-            groups = match.groups()
-            return int(groups[0]) * 1024
-        return None
+        fields = out.decode().split(None, 1)
+        if not fields:
+            return None
+        return int(fields[0]) * 1024
 
-    def filesize(self, path):
-        cmd = f'stat "{path}" -c "%s"'
-        (_i, stdout, _e) = self.exec(cmd)
-        size_str = stdout.read().decode()
+    @staticmethod
+    def _filesize_command(path):
+        return f'stat "{path}" -c "%s"'
+
+    @staticmethod
+    def _parse_filesize(out: bytes) -> Optional[int]:
         try:
-            return int(size_str)
+            return int(out.decode())
         except ValueError as e:
             return None
 
-    def path_exists(self, path):
+    def filesize(self, path):
+        (_status, out, _err) = self.exec_capture(self._filesize_command(path))
+        return self._parse_filesize(out)
+
+    def filesizes(self, paths) -> List[Optional[int]]:
+        """
+        filesize() for several paths using a single exec.
+        """
+        results = self.exec_many([self._filesize_command(p) for p in paths])
+        return [self._parse_filesize(out) for (_status, out) in results]
+
+    def _path_exists_command(self, path):
         cmd = f"ls -1 {path}"
         if self.requires_sudo:
             cmd = "sudo " + cmd
-        exists_status = self.exec_statusonly(cmd)
+        return cmd
+
+    def path_exists(self, path):
+        exists_status = self.exec_statusonly(self._path_exists_command(path))
         return exists_status == 0
 
+    def paths_exist(self, paths) -> List[bool]:
+        """
+        path_exists() for several paths using a single exec.
+        """
+        results = self.exec_many([self._path_exists_command(p) for p in paths])
+        return [status == 0 for (status, _out) in results]
+
 
 class LocalShell(Shell):
+    # id contexts keyed by (shell class, effective uid), shared across instances.
+    _id_ctx_cache = {}
+
     def __init__(self, ssh_keyfile=None, requires_sudo=True):
         super().__init__(
             remote=False, ssh_keyfile=ssh_keyfile, requires_sudo=requires_sudo
         )
 
+        # Environment for interactive commands, copied from os.environ by the
+        # first one and reused; later changes to os.environ are not seen.
+        self._base_env = None
+
     @property
     def description(self):
         return "local shell"
 
+    def _id_context(self):
+        euid = os.geteuid()
+        if euid == 0:
+            # The same shape id_parse returns for root.
+            return {"uid": (0, "root"), "gid": (0, "root"), "groups": [(0, "root")]}
+
+        key = (type(self), euid)
+        ctx = LocalShell._id_ctx_cache.get(key)
+        if not ctx:
+            ctx = self.id()
+            if ctx:
+                LocalShell._id_ctx_cache[key] = ctx
+        return ctx
+
     def exec(
         self, command: str, requires_sudo=None
     ) -> Tuple[ShellIO, ShellIO, ShellIO]:
-        if requires_sudo is False:
-            pass
-        elif requires_sudo is True:
-            command = self._sudoify(command, force_sudo=True)
-        elif requires_sudo is None:
-            command = self._sudoify(command)
-
-        proc = subprocess.Popen(
-            command,
-            shell=True,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
+        command = self._prepare_command(command, requires_sudo)
+
+        proc = _spawn(subprocess.Popen, command, **_POPEN_KW)
 
         return (
             LocalShellIO(proc, "stdin"),
@@ -199,23 +414,45 @@ class LocalShell(Shell):
             LocalShellIO(proc, "stderr"),
         )
 
-    def interact(self, command: str) -> PtyShellExpect:
+    def exec_capture(
+        self, command: str, requires_sudo=None
+    ) -> Tuple[int, bytes, bytes]:
+        command = self._prepare_command(command, requires_sudo)
+
+        proc = _spawn(subprocess.run, command, **_RUN_KW)
+        return (proc.returncode, proc.stdout, proc.stderr)
+
+    def interact(self, command: Union[str, List[str]]) -> PtyShellExpect:
         ptyproc = self._exec_pty(command)
         return PtyShellExpect(ptyproc)
 
     def _exec_pty(
-        self, command: str, cwd=None, env=None, term="vt100", echo=None
+        self,
+        command: Union[str, List[str]],
+        cwd=None,
+        env=None,
+        term="vt100",
+        echo=None,
     ) -> ptyprocess.PtyProcess:
         cwd = cwd or os.getcwd()
-        pty_env = env or dict(os.environ)
-        echo = True if env is None else env
+        echo = True if echo is None else echo
+
+        if not env and self._base_env is None:
+            self._base_env = {**os.environ, "TERM": "vt100"}
 
-        if not env:
-            pty_env["TERM"] = term or "vt100"
+        if env:
+            pty_env = env
+        elif not term or term == "vt100":
+            pty_env = self._base_env
+        else:
+            pty_env = {**self._base_env, "TERM": term}
 
-        argv = split_command_line(command)
+        if isinstance(command, str):
+            argv = split_command_line(command)
+        else:
+            argv = list(command)
 
-        ptyproc = ptyprocess.PtyProcess.spawn(argv, os.getcwd(), env=pty_env, echo=True)
+        ptyproc = ptyprocess.PtyProcess.spawn(argv, cwd, env=pty_env, echo=echo)
         return ptyproc
 
 
@@ -230,20 +467,23 @@ class RemoteShell(Shell):
     def description(self):
         return self.hostname
 
+    def _id_context(self):
+        # Every RemoteShell on the same client logs in as the same user.
+        if not self.client._cached_id_ctx:
+            self.client._cached_id_ctx = self.id()
+        return self.client._cached_id_ctx
+
     def exec(
         self, command: str, requires_sudo=None
     ) -> Tuple[ShellIO, ShellIO, ShellIO]:
-        if requires_sudo is False:
-            pass
-        elif requires_sudo is True:
-            command = self._sudoify(command, force_sudo=True)
-        elif requires_sudo is None:
-            command = self._sudoify(command)
+        command = self._prepare_command(command, requires_sudo)
 
         stdin, stdout, stderr = self.client.exec_command(command)
         return (RemoteShellIO(stdin), RemoteShellIO(stdout), RemoteShellIO(stderr))
 
-    def interact(self, command: str) -> PtyShellExpect:
+    def interact(self, command: Union[str, List[str]]) -> PtyShellExpect:
+        if not isinstance(command, str):
+            command = shlex.join(command)
         (_stdin, stdout, stderr) = self.client.exec_command(command, get_pty=True)
         return RemotePtyShellExpect(_stdin, stdout)
 
@@ -261,23 +501,39 @@ class RemoteShell(Shell):
 
     @staticmethod
     def establish_connection(
-        remote_server, username, password, ssh_keyfile=None, keepalive=None
+        remote_server,
+        username,
+        password,
+        ssh_keyfile=None,
+        keepalive=None,
+        connect_kwargs=None,
+        retries=2,
     ):
-        is_ssh_valid = False
-        r_client = None
+        """
+        retries: How many more times to try connecting after a transient failure,
+            waiting 1s, 2s, 4s, ... between attempts. Authentication and host key
+            failures are not retried.
+        """
+        if username is None or password is None:
+            return None
 
-        while not is_ssh_valid:
-            if username is None or password is None:
-                return None
+        r_client = WrappedSSHClient(
+            remote_server,
+            username,
+            password,
+            keepalive=keepalive,
+            connect_kwargs=connect_kwargs,
+        )
+
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                time.sleep(2 ** (attempt - 1))
 
-            r_client = WrappedSSHClient(
-                remote_server, username, password, keepalive=keepalive
-            )
             if r_client.connect(remote_server, username, password):
-                is_ssh_valid = True
-            else:
-                logger.error("SSH INVALID")
-                return None
+                return RemoteShell(r_client, ssh_keyfile=ssh_keyfile)
 
-        rsh = RemoteShell(r_client, ssh_keyfile=ssh_keyfile)
-        return rsh
+            logger.error("SSH INVALID (attempt %d of %d)", attempt + 1, retries + 1)
+            if not is_transient_error(r_client.connect_error):
+                break
+
+        return None
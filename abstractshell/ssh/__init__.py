@@ -1,4 +1,5 @@
 import os
+import socket
 import sys
 
 import paramiko
@@ -12,6 +13,22 @@ logger = logging.getLogger("shellutil-ssh")
 
 interact_logger = logging.getLogger("ssh-client-interaction")
 
+# Seconds between transport keepalive packets unless the caller picks another
+# interval; 0 disables them.
+DEFAULT_KEEPALIVE = 30
+
+
+def is_transient_error(exc) -> bool:
+    """
+    Whether a failed connect is worth retrying: network trouble or a broken
+    handshake, but not rejected credentials or a mismatched host key.
+    """
+    if isinstance(
+        exc, (paramiko.AuthenticationException, paramiko.BadHostKeyException)
+    ):
+        return False
+    return isinstance(exc, (socket.error, SSHException))
+
 
 def interaction_output_func(msg):
     sys.stdout.write(msg)
@@ -25,13 +42,30 @@ class WrappedSSHClient:
     This is a wrapper that permits us to re-connect if an SSH connection becomes stale.
     """
 
-    def __init__(self, hostname=None, username=None, password=None, keepalive=None):
+    def __init__(
+        self,
+        hostname=None,
+        username=None,
+        password=None,
+        keepalive=None,
+        connect_kwargs=None,
+    ):
+        """
+        connect_kwargs: Extra keyword arguments for paramiko's SSHClient.connect,
+            e.g. look_for_keys=False to skip probing ~/.ssh when using a password.
+        """
         self.client = paramiko.SSHClient()
         self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.hostname = hostname
         self.username = username
         self.password = password
-        self.keepalive = keepalive
+        self.keepalive = DEFAULT_KEEPALIVE if keepalive is None else keepalive
+        self.connect_kwargs = connect_kwargs or {}
+
+        # id output for username, cached by RemoteShell.
+        self._cached_id_ctx = None
+        # Why the last connect() returned False, if it did.
+        self.connect_error = None
 
     def close(self):
         return self.client.close()
@@ -42,21 +76,26 @@ class WrappedSSHClient:
         password = password or self.password
 
         try:
-            self.client.connect(
-                hostname=hostname,
-                username=username,
-                password=password,
-            )
-
-            if self.keepalive:
-                transport = self.client.get_transport()
-                transport.set_keepalive(self.keepalive)
-
+            self._connect(hostname, username, password)
+            self.connect_error = None
             return True
-        except Exception:
+        except Exception as e:
+            self.connect_error = e
             self.client.close()
             return False
 
+    def _connect(self, hostname, username, password):
+        self.client.connect(
+            hostname=hostname,
+            username=username,
+            password=password,
+            **self.connect_kwargs,
+        )
+
+        if self.keepalive:
+            transport = self.client.get_transport()
+            transport.set_keepalive(self.keepalive)
+
     def interact(self):
         try:
             term_size = os.get_terminal_size()
@@ -93,16 +132,7 @@ class WrappedSSHClient:
         except SSHException as e:
             if retries > 0:
                 try:
-                    self.client.connect(
-                        hostname=self.hostname,
-                        username=self.username,
-                        password=self.password,
-                    )
-
-                    if self.keepalive:
-                        transport = self.client.get_transport()
-                        transport.set_keepalive(self.keepalive)
-
+                    self._connect(self.hostname, self.username, self.password)
                     logger.info("Successfully reconnected to SSH")
 
                 except SSHException as e:
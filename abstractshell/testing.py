@@ -1,23 +1,43 @@
-import os
+import shlex
 
 from .shells import LocalShell
 
 
 class MockShell(LocalShell):
     """
-    A shell which chroots to an isolated test directory against which
-    to test commands
+    A shell which runs each command chrooted to an isolated test directory
+    against which to test commands. The calling process is left untouched.
     """
 
-    _existing_mock_shell = None
-
     def __init__(self, root_path, ssh_keyfile=None, requires_sudo=True):
-        if self._existing_mock_shell:
-            raise AttributeError(
-                "_existing_mock_shell already defined. Do not instantiate more than one mock shell."
-            )
-
         super().__init__(ssh_keyfile=ssh_keyfile, requires_sudo=requires_sudo)
-        MockShell._existing_mock_shell = self
+        self.root_path = root_path
+
+    def _chroot(self, command) -> str:
+        if not isinstance(command, str):
+            command = shlex.join(command)
+        return f"chroot {shlex.quote(self.root_path)} /bin/sh -c {shlex.quote(command)}"
+
+    def _id_context(self):
+        # Whether to sudo is decided by the calling user, so the id lookup runs
+        # outside the chroot; chrooting to run it would itself need root.
+        return LocalShell(requires_sudo=False)._id_context()
+
+    def exec(self, command: str, requires_sudo=None):
+        return super().exec(self._chroot(command), requires_sudo=requires_sudo)
+
+    def exec_capture(self, command: str, requires_sudo=None):
+        return super().exec_capture(self._chroot(command), requires_sudo=requires_sudo)
+
+    def exec_many(self, commands, requires_sudo=None):
+        # Sudo the chroot around the whole script; inside it the commands
+        # already run as root.
+        if not commands:
+            return []
+
+        script = self._exec_many_script(commands)
+        (_status, out, _err) = self.exec_capture(script, requires_sudo=requires_sudo)
+        return self._exec_many_results(out, len(commands))
 
-        os.chroot(root_path)
+    def _exec_pty(self, command: str, *args, **kwargs):
+        return super()._exec_pty(self._chroot(command), *args, **kwargs)
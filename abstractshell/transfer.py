@@ -2,6 +2,8 @@ import logging
 import sys
 import os
 import re
+import shlex
+import time
 from tqdm import tqdm
 from enum import Enum
 
@@ -17,6 +19,88 @@ logger = logging.getLogger("transfer")
 
 RsyncPathTypes = Union[str, AbstractPath]
 
+# Only the groups that are read are capturing.
+_RE_PROGRESS_MULTI = re.compile(
+    r"\s+\d+\s*\d+%\s+[\d\.]+.B\/s\s+[0-9:]+\s\(xfer#\d+,\sto-check\=(\d+)\/(\d+)\)"
+)
+_RE_FILENAME = re.compile(r"([\w\/]+)\r")
+_RE_SUMMARY = re.compile(r"total size is (\d+)\s+speedup is ([\d\.]+)")
+_RE_PROGRESS_SINGLE = re.compile(r"\s+(\d+)\s*\d+%\s+[\d\.]+.B\/s\s+[0-9:]+")
+_RE_PASSWORD = re.compile(r".*@.*'s password:\s*")
+_RE_ANY_LINE = re.compile(r".*\n")
+
+# Minimum number of seconds between file name updates under the progress bar.
+_NAME_UPDATE_INTERVAL = 0.1
+# The multi-file progress bar is moved once this many files have completed, or
+# once this many seconds have passed since it last moved.
+_PROGRESS_MIN_DELTA = 8
+_PROGRESS_UPDATE_INTERVAL = 0.1
+
+# The multi-file progress patterns, named after the MultiProgressState each
+# one leads to, are combined into one alternation so that each line of rsync
+# output is scanned once. Alternatives are tried in order, as in a pattern list.
+_MULTI_ALTERNATIVES = (
+    ("PROGRESS_INFO", _RE_PROGRESS_MULTI),
+    ("FILE_NAME", _RE_FILENAME),
+    ("SUMMARY", _RE_SUMMARY),
+)
+_MULTI_UNION = re.compile(
+    "|".join(f"(?P<{name}>{r_ex.pattern})" for (name, r_ex) in _MULTI_ALTERNATIVES)
+)
+# Where each alternative's own groups sit in _MULTI_UNION's match.groups().
+_MULTI_GROUPS = {
+    name: slice(
+        _MULTI_UNION.groupindex[name], _MULTI_UNION.groupindex[name] + r_ex.groups
+    )
+    for (name, r_ex) in _MULTI_ALTERNATIVES
+}
+
+
+class _Prefiltered:
+    """
+    A compiled pattern that is only run on lines containing needle, a literal
+    that every match includes. str.find rules most lines out far more cheaply
+    than a failed match.
+    """
+
+    __slots__ = ("regex", "needle")
+
+    def __init__(self, regex, needle):
+        self.regex = regex
+        self.needle = needle
+
+    def match(self, string, pos=0, endpos=sys.maxsize):
+        if string.find(self.needle, pos, endpos) < 0:
+            return None
+        return self.regex.match(string, pos, endpos)
+
+
+# Pattern lists for expect_match, indexed by the branches of
+# RsyncProgress._single_progress and Rsync.run respectively.
+_SINGLE_PATTERNS = (
+    shell_expect.EOF,
+    _Prefiltered(_RE_PROGRESS_SINGLE, "%"),
+    _Prefiltered(_RE_SUMMARY, "total size is "),
+)
+_PASSWORD_PATTERNS = (
+    shell_expect.EOF,
+    _Prefiltered(_RE_PASSWORD, "'s password:"),
+    _RE_ANY_LINE,
+)
+
+
+class _ProgressState:
+    """
+    Multi-file progress as last reported by rsync, ahead of the progress bar.
+    """
+
+    __slots__ = ("total", "n", "last_update")
+
+    def __init__(self, total):
+        self.total = total
+        self.n = 0
+        self.last_update = 0.0
+
 
 class RsyncProgress:
     class MultiProgressState(Enum):
@@ -40,89 +124,104 @@ class RsyncProgress:
     def _multiple_progress(self):
         interact = self.interact
 
-        progress_bar = None
-
         # progress = tqdm(
         #    total=self.filesize, unit="B", unit_scale=True, unit_divisor=1024
         # )
-        progress_closed = False
+        self._progress_bar = None
+        self._progress_state = None
+        self._progress_closed = False
+        self._last_name_update = 0.0
 
-        state = RsyncProgress.MultiProgressState.INITIALIZING
+        handlers = {
+            RsyncProgress.MultiProgressState.PROGRESS_INFO: self._handle_progress_info,
+            RsyncProgress.MultiProgressState.FILE_NAME: self._handle_file_name,
+            RsyncProgress.MultiProgressState.SUMMARY: self._handle_summary,
+        }
 
-        def _print_me(*args, **kwargs):
-            with open("/tmp/rsync-out.log", "a") as f:
-                kwargs["file"] = f
-                print(*args, **kwargs)
+        def _log_output(line):
+            logger.debug("rsync output: %r", line)
+
+        # Raw output lines are only passed on when someone is listening.
+        log_output = logger.isEnabledFor(logging.DEBUG)
 
         while True:
-            (match, i) = interact.expect_match(
-                [
-                    shell_expect.EOF,
-                    r"\s+(\d+)\s*(\d+)%\s+([\d\.]+.B\/s)\s+([0-9:]+)\s\(xfer#(\d+),\sto-check\=(\d+)\/(\d+)\)",
-                    r"([\w\/]+)\r",
-                    r"total size is (\d+)\s+speedup is ([\d\.]+)",
-                ],
-                echo=True,
-                printfn=_print_me,
+            (match, name) = interact.expect_union(
+                _MULTI_UNION, echo=log_output, printfn=_log_output
             )
+            if match is shell_expect.EOF:
+                break
 
-            try:
-                state = RsyncProgress.MultiProgressState(i)
-            except ValueError:
-                logger.error("State %s does not exist in MultiProgressState")
-                continue
-
-            if state == RsyncProgress.MultiProgressState.PROGRESS_INFO:
-                (
-                    _transferred,
-                    _percentage,
-                    _speed_str,
-                    _time,
-                    xfer,
-                    check,
-                    check_total,
-                ) = match.groups()
-                xfer = int(xfer)
-                check = int(check)
-                check_total = int(check_total)
-
-                if progress_bar is None:
-                    progress_bar = tqdm(
-                        total=int(check_total),
-                        unit="files",
-                        position=0,
-                        leave=True,
-                    )
-                else:
-                    if progress_bar.total < check_total:
-                        progress_bar.total = check_total
-
-                    # deltaN = (T - Tc) - n
-                    update_n = (progress_bar.total - check) - progress_bar.n
-                    progress_bar.update(update_n)
-            elif state == RsyncProgress.MultiProgressState.FILE_NAME:
-                name = match.groups()[0]
-                if progress_bar:
-                    progress_bar.display(name, 1)
-            elif state == RsyncProgress.MultiProgressState.SUMMARY:
-                size, speedup = match.groups()
-                speedup = float(speedup)
-
-                if progress_bar:
-                    progress_bar.update(progress_bar.total - progress_bar.n)
-                    progress_bar.close()
-                    sys.stderr.flush()
-                progress_closed = True
-
-                if speedup > 1.0:
-                    print(f"rsync speedup factor was {speedup}")
+            state = RsyncProgress.MultiProgressState[name]
+            handlers[state](match.groups()[_MULTI_GROUPS[name]])
 
-            elif state == RsyncProgress.MultiProgressState.EOF:
-                break
+        progress_bar = self._progress_bar
+        if progress_bar and not self._progress_closed:
+            # Without a summary line, catch up on any updates that were held back.
+            progress_bar.n = self._progress_state.n
+            progress_bar.close()
+            sys.stderr.flush()
 
-        if progress_bar and not progress_closed:
+    def _handle_progress_info(self, groups):
+        # groups: files left to check, total files
+        check = int(groups[0])
+        check_total = int(groups[1])
+
+        progress_bar = self._progress_bar
+        if progress_bar is None:
+            self._progress_bar = tqdm(
+                total=check_total,
+                unit="files",
+                position=0,
+                leave=True,
+            )
+            self._progress_state = _ProgressState(check_total)
+            return
+
+        state = self._progress_state
+        if state.total < check_total:
+            state.total = progress_bar.total = check_total
+
+        # N = T - Tc, shown once enough has changed to be worth a repaint.
+        state.n = state.total - check
+        delta = state.n - progress_bar.n
+        if not delta:
+            return
+
+        now = time.monotonic()
+        if (
+            delta >= _PROGRESS_MIN_DELTA
+            or now - state.last_update >= _PROGRESS_UPDATE_INTERVAL
+        ):
+            progress_bar.update(delta)
+            state.last_update = now
+
+    def _handle_file_name(self, groups):
+        if not self._progress_bar:
+            return
+
+        # rsync can list many files per second, each one a terminal repaint.
+        now = time.monotonic()
+        if now - self._last_name_update < _NAME_UPDATE_INTERVAL:
+            return
+        self._last_name_update = now
+
+        name = groups[0]
+        self._progress_bar.display(name, 1)
+
+    def _handle_summary(self, groups):
+        size, speedup = groups
+        speedup = float(speedup)
+
+        progress_bar = self._progress_bar
+        if progress_bar:
+            # close() repaints the bar, so there is no need for an update().
+            progress_bar.n = progress_bar.total
             progress_bar.close()
             sys.stderr.flush()
+        self._progress_closed = True
+
+        if speedup > 1.0:
+            print(f"rsync speedup factor was {speedup}")
 
     def _single_progress(self):
         interact = self.interact
@@ -139,21 +238,13 @@ class RsyncProgress:
         progress_closed = False
 
         while True:
-            (match, i) = interact.expect_match(
-                [
-                    shell_expect.EOF,
-                    r"\s+(\d+)\s*(\d+)%\s+([\d\.]+.B\/s)\s+([0-9:]+)",
-                    r"total size is (\d+)\s+speedup is ([\d\.]+)",
-                ],
-                echo=False,
-            )
+            (match, i) = interact.expect_match(_SINGLE_PATTERNS, echo=False)
 
             if i == 0:
                 return
 
             if i == 1:
-                size, _percent, _speed, _elapsed = match.groups()
-                size = int(size)
+                size = int(match.group(1))
                 progress.update(size - prev_size)
                 prev_size = size
             if i == 2:
@@ -162,7 +253,7 @@ class RsyncProgress:
                 size = int(size)
                 speedup = float(speedup)
 
-                progress.update(size - prev_size)
+                progress.n = size
                 progress_closed = True
                 progress.close()
                 sys.stderr.flush()
@@ -180,6 +271,7 @@ class RsyncCommand:
         self.remote_rsync = None
         self.flags = "az"
         self.exclusions = None
+        self._exclude_args = ()
         self.rsh = None
         self.progress = True
         self.delete = False
@@ -198,6 +290,8 @@ class RsyncCommand:
 
     def set_exclusions(self, exclusions):
         self.exclusions = exclusions
+        # Built once here rather than every time the command is rendered.
+        self._exclude_args = tuple(f"--exclude={e}" for e in exclusions or ())
 
     def set_source(self, source):
         self.source = source
@@ -211,7 +305,7 @@ class RsyncCommand:
     def delete_remote_files(self, delete):
         self.delete = delete
 
-    def _string(self):
+    def as_argv(self):
         if not self.source or not self.destination:
             raise RuntimeError(
                 "source and destination must be supplied for a valid rsync command."
@@ -225,13 +319,13 @@ class RsyncCommand:
         cmd.flags(self.flags or "az")
         cmd.progress(self.progress)
         cmd.delete(self.delete)
-        cmd.exclusions(self.exclusions)
+        cmd.exclusions(self._exclude_args)
         cmd.source(self.source)
         cmd.destination(self.destination)
-        return cmd.command
+        return cmd.argv
 
     def __str__(self):
-        return self._string()
+        return shlex.join(self.as_argv())
 
     def __repr__(self):
         return str(self)
@@ -239,43 +333,44 @@ class RsyncCommand:
 
 class RsyncCommandBuilder:
     def start(self):
-        self.command = "rsync"
+        self.argv = ["rsync"]
+
+    @property
+    def command(self):
+        return shlex.join(self.argv)
 
     def remote_rsync(self, remote):
         if remote:
-            self.command += f' --rsync-path="{remote}" '
+            self.argv.append(f"--rsync-path={remote}")
 
-    def exclusions(self, exclusions):
-        if exclusions:
-            exclusion_strings = [f"--exclude={e}" for e in exclusions]
-            self.command += " " + " ".join(exclusion_strings)
+    def exclusions(self, exclude_args):
+        if exclude_args:
+            self.argv.extend(exclude_args)
 
     def remote_shell(self, rsh):
         if rsh:
-            self.command += f' -e "{rsh}"'
+            self.argv.extend(("-e", rsh))
 
     def flags(self, flags):
         if flags:
-            self.command += f" -{flags}"
+            self.argv.append(f"-{flags}")
 
     def progress(self, use_progress):
         if use_progress:
-            self.command += f" --no-human-readable --progress"
+            self.argv.extend(("--no-human-readable", "--progress"))
 
     def delete(self, use_delete):
         if use_delete:
-            self.command += f" --delete"
+            self.argv.append("--delete")
 
     def source(self, source):
-        self.command += f" {source}"
+        self.argv.append(f"{source}")
 
     def destination(self, dest):
-        self.command += f" {dest}"
+        self.argv.append(f"{dest}")
 
 
 class Rsync:
-    remote_re = re.compile(r"^([^/]+@)?([^/]+):(.*)$")
-
     def __init__(
         self,
         sudo=True,
@@ -305,7 +400,8 @@ class Rsync:
         if not dest_folder.isdir():
             dest_folder.mkdir()
 
-        if source.isdir():
+        source_isdir = source.isdir()
+        if source_isdir:
             multiple = True
             filesize = None
         elif source.isfile():
@@ -315,79 +411,97 @@ class Rsync:
             logger.error("source %s does not exist", str(source))
             return False
 
-        (cmd_shell, dest_shell, cmd) = self.generate_command(source, dest, exclusions)
-        expect_password = not source.uses_shell(dest.shell)
+        same_shell = source.uses_shell(dest.shell)
+        (cmd_shell, dest_shell, cmd) = self.generate_command(
+            source,
+            dest,
+            exclusions,
+            source_isdir=source_isdir,
+            same_shell=same_shell,
+        )
+        expect_password = not same_shell
         logger.info("rsync_args %s", str(cmd))
 
-        interact = cmd_shell.interact(str(cmd))
-        if expect_password:
-            res = interact.expect(
-                [shell_expect.EOF, r".*@.*'s password:\s*", r".*\n"], echo=False
-            )
-            if res == 1:
-                password = password or dest_shell.password
-                if password is None:
-                    logger.error("rsync expected a password and none was provided.")
-                    password = questionary.password(
-                        "Enter a password since none was provided"
-                    ).ask()
-                elif callable(password):
-                    password = password()
-
-                if password is None:
+        argv = cmd.as_argv()
+        while True:
+            interact = cmd_shell.interact(argv)
+            if expect_password:
+                res = interact.expect(_PASSWORD_PATTERNS, echo=False)
+                if res == 1:
+                    password = password or dest_shell.password
+                    if password is None:
+                        logger.error("rsync expected a password and none was provided.")
+                        password = questionary.password(
+                            "Enter a password since none was provided"
+                        ).ask()
+                    elif callable(password):
+                        password = password()
+
+                    if password is None:
+                        return False
+
+                    interact.send(password)
+
+            print("progress_bar", progress_bar)
+            if progress_bar:
+                progress = RsyncProgress(interact, filesize, multiple=multiple)
+                progress.progress()
+
+            if progress_bar:
+                exitstatus = interact.wait_exit_status()
+            else:
+                exitstatus = interact.wait_exit_status(echo=False)
+
+            if exitstatus == 255:
+                if not hasattr(dest_shell, "hostname"):
+                    logger.error(
+                        "SSH key mismatch on rsync transfer. Please fix the error manually."
+                    )
                     return False
 
-                interact.send(password)
+                questionary.print("  Mismatched host key found in known_hosts file.")
+                res = questionary.confirm(
+                    "Do you want to automatically remove it and retry?"
+                ).unsafe_ask()
+                if not res:
+                    return False
 
-        print("progress_bar", progress_bar)
-        if progress_bar:
-            progress = RsyncProgress(interact, filesize, multiple=multiple)
-            progress.progress()
+                interact = cmd_shell.interact(f"ssh-keygen -R {dest_shell.hostname}")
+                interact.expect(shell_expect.EOF)
+
+                # Nothing about the paths has changed, so the same command is retried.
+                continue
+            break
 
-        if progress_bar:
-            exitstatus = interact.wait_exit_status()
-        else:
-            exitstatus = interact.wait_exit_status(echo=False)
-
-        if exitstatus == 255:
-            if not hasattr(dest_shell, "hostname"):
-                logger.error(
-                    "SSH key mismatch on rsync transfer. Please fix the error manually."
-                )
-                return False
-
-            questionary.print("  Mismatched host key found in known_hosts file.")
-            res = questionary.confirm(
-                "Do you want to automatically remove it and retry?"
-            ).unsafe_ask()
-            if not res:
-                return False
-
-            interact = cmd_shell.interact(f"ssh-keygen -R {dest_shell.hostname}")
-            interact.expect(shell_expect.EOF)
-
-            return self.run(
-                source,
-                dest,
-                exclusions=exclusions,
-                password=password,
-                progress_bar=progress_bar,
-            )
         if exitstatus not in [0, 24]:
             logger.error("Error occurred during rsync: %s", exitstatus)
         return exitstatus in [0, 24]
 
     def generate_command(
-        self, source: AbstractPath, dest: AbstractPath, exclusions=None
+        self,
+        source: AbstractPath,
+        dest: AbstractPath,
+        exclusions=None,
+        source_isdir=None,
+        dest_isdir=None,
+        same_shell=None,
     ):
+        """
+        source_isdir, dest_isdir, same_shell: Already known results of
+            source.isdir(), dest.isdir() and source.uses_shell(dest.shell), to
+            avoid querying the (possibly remote) paths again.
+        """
         rsync_cmd = RsyncCommand()
 
-        same_shell = source.uses_shell(dest.shell)
+        if same_shell is None:
+            same_shell = source.uses_shell(dest.shell)
         shell = source.shell
         dest_shell = dest.shell
 
-        source_isdir = source.isdir()
-        dest_isdir = dest.isdir()
+        if source_isdir is None:
+            source_isdir = source.isdir()
+        if dest_isdir is None:
+            dest_isdir = dest.isdir()
 
         if same_shell:
             source_string = source.local_path
@@ -0,0 +1,21 @@
+from abstractshell.id import id_parse
+
+
+class TestIdParse:
+    def test_parse_groups(self):
+        ctx = id_parse(
+            "uid=1000(test-user) gid=1000(test-user) groups=1000(test-user),10(wheel),998(docker)\n"
+        )
+
+        assert ctx["uid"] == (1000, "test-user")
+        assert ctx["gid"] == (1000, "test-user")
+        assert ctx["groups"] == [(1000, "test-user"), (10, "wheel"), (998, "docker")]
+
+    def test_parse_root(self):
+        ctx = id_parse("uid=0(root) gid=0(root) groups=0(root)")
+
+        assert ctx["uid"] == (0, "root")
+        assert ctx["groups"] == [(0, "root")]
+
+    def test_parse_invalid(self):
+        assert id_parse("id: 'nobody-here': no such user") is None
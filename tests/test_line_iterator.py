@@ -1,24 +1,70 @@
 import pytest
 
-from io import StringIO
 from abstractshell.shell_expect import SpecialConstants, PtyShellExpect
 from abstractshell import shell_expect
 
+# Reads are served in page-sized chunks, as a real pty would return them.
+READ_SIZE = 4096
+
 
 class MockInteraction(PtyShellExpect):
     def __init__(self, pty_input):
         super().__init__(None, echo=True)
-        self.pty_input = StringIO(pty_input)
+        self.pty_input = pty_input
+        self.read_pos = 0
 
-    def _read_pty(self):
-        return self.pty_input.read() or SpecialConstants.EOF
+    def _read_pty(self, timeout=0):
+        data = self.pty_input[self.read_pos : self.read_pos + READ_SIZE]
+        self.read_pos += len(data)
+        return data or SpecialConstants.EOF
 
     def _write(self, line, flush=False):
         pass
 
     def feed_pty(self, pty_input):
-        l = self.pty_input.write(pty_input)
-        self.pty_input.seek(self.pty_input.tell() - l)
+        self.pty_input += pty_input
+
+
+class ScreenInteraction(MockInteraction):
+    """
+    Passes each chunk through the pyte screen, as PtyShellExpect does with real
+    pty output.
+    """
+
+    def __init__(self, chunks):
+        super().__init__("")
+        self.chunks = list(chunks)
+
+    def _read_pty(self, timeout=0):
+        if not self.chunks:
+            return SpecialConstants.EOF
+        return self._feed_screen(self.chunks.pop(0))
+
+
+class SlowReplyInteraction(PtyShellExpect):
+    """
+    Echoes what is sent to it, but like a process that takes a moment to reply:
+    the reply only reaches reads that wait for output.
+    """
+
+    def __init__(self):
+        super().__init__(None, echo=True)
+        self.pending = b""
+
+    def _continue_read(self):
+        return True
+
+    def _read(self, n=4096, timeout=0):
+        if not timeout:
+            return b""
+        if not self.pending:
+            return SpecialConstants.EOF
+
+        (data, self.pending) = (self.pending[:n], self.pending[n:])
+        return data
+
+    def _write(self, data, flush=False):
+        self.pending += data
 
 
 class TestInteraction:
@@ -38,11 +84,24 @@ class TestInteraction:
         res = interact.expect([shell_expect.PROMPT, "Test Output"])
         assert res == 1
 
+    def test_send_keeps_earlier_output(self):
+        interact = SlowReplyInteraction()
+        interact.send("first")
+        interact.send("second")
+
+        assert interact.expect([shell_expect.EOF, "first", "second"]) == 1
+
     def test_eof_exception(self):
         interact = MockInteraction("")
         with pytest.raises(shell_expect.ShellExpectEOF) as ctx:
             interact.expect("TEST ME")
 
+    def test_try_expect_eof(self):
+        interact = MockInteraction("Test Output\r\n")
+
+        assert interact.try_expect("Test Output") == 0
+        assert interact.try_expect("Test Output") is None
+
     def test_expect_lf_only(self):
         interact = MockInteraction("Test Output\n")
 
@@ -68,3 +127,14 @@ class TestLineIterator:
 
         assert interact.line_itr.exhaust_buffer() == "HELLO WORLD"
         assert interact.line_itr.exhaust_buffer() == shell_expect.EOF
+
+    def test_escape_split_across_reads(self):
+        # Patterns match from the start of a line, so any leftover of a split
+        # sequence drawn as text would stop them from matching.
+        interact = ScreenInteraction(
+            ["\x1b[3", "1mHello World\r\n", "\x1b]0;ti", "tle\x07Done\r\n"]
+        )
+
+        assert interact.expect([shell_expect.EOF, "Hello World"]) == 1
+        assert interact.expect([shell_expect.EOF, "Done"]) == 1
+        assert interact.expect([shell_expect.EOF, "."]) == 0
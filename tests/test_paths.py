@@ -0,0 +1,90 @@
+import os
+import shutil
+
+import pytest
+
+from abstractshell import transfer
+from abstractshell.paths import RemotePath
+from abstractshell.shells import LocalShell
+
+
+class CountingShell(LocalShell):
+    """
+    A local shell posing as a remote one, recording each command it execs.
+    """
+
+    def __init__(self):
+        super().__init__(requires_sudo=False)
+        self.commands = []
+
+    def exec(self, command, requires_sudo=None):
+        self.commands.append(command)
+        return super().exec(command, requires_sudo=requires_sudo)
+
+    def stats(self, path):
+        return sum(
+            cmd.startswith("stat ") and cmd.endswith(path.local_path)
+            for cmd in self.commands
+        )
+
+
+class LocalRsync:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def transfer_file(self, src, dest):
+        shutil.copyfile(src.local_path, dest.local_path)
+        return True
+
+
+@pytest.fixture
+def shell(monkeypatch):
+    monkeypatch.setattr(transfer, "RsyncBase", LocalRsync)
+    return CountingShell()
+
+
+def remote(shell, path):
+    return RemotePath(f"localhost:{path}", shell)
+
+
+class TestRemotePathStatCache:
+    def test_one_stat_for_isdir_and_isfile(self, shell, tmp_path):
+        path = remote(shell, tmp_path)
+
+        assert path.isdir()
+        assert not path.isfile()
+        assert shell.stats(path) == 1
+
+    def test_failed_stat_not_cached(self, shell, tmp_path):
+        path = remote(shell, tmp_path / "missing")
+
+        assert not path.isfile()
+        assert not path.isdir()
+        assert shell.stats(path) == 2
+
+    @pytest.mark.parametrize(
+        "mutate",
+        [
+            lambda path, other: path.mkdir(),
+            lambda path, other: path.write_contents("abc"),
+            lambda path, other: path.unlink(),
+            lambda path, other: other.rename(path),
+            lambda path, other: other.copyto(path),
+        ],
+        ids=["mkdir", "write_contents", "unlink", "rename", "copyto"],
+    )
+    def test_mutation_clears_cache(self, shell, tmp_path, mutate):
+        (tmp_path / "other").write_text("other")
+        path = remote(shell, tmp_path / "path")
+        other = remote(shell, tmp_path / "other")
+
+        path.isfile()
+        mutate(path, other)
+        path.isfile()
+        assert shell.stats(path) == 2
+
+    def test_filesize_follows_symlink(self, shell, tmp_path):
+        (tmp_path / "target").write_text("abc")
+        os.symlink(tmp_path / "target", tmp_path / "link")
+
+        assert remote(shell, tmp_path / "link").filesize() == 3
@@ -0,0 +1,167 @@
+import os
+import subprocess
+import time
+
+import paramiko
+
+from abstractshell import shells
+from abstractshell.id import id_parse
+from abstractshell.shell_expect import EOF
+from abstractshell.shells import LocalShell, RemoteShell, _split_command
+from abstractshell.ssh import WrappedSSHClient
+from abstractshell.testing import MockShell
+
+
+class TestLocalShell:
+    def test_exec_argv(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "a b").write_bytes(b"abc")
+        shell = LocalShell(requires_sudo=False)
+
+        assert _split_command('stat "a b" -c "%s"') == ["stat", "a b", "-c", "%s"]
+        assert shell.exec_capture('stat "a b" -c "%s"') == (0, b"3\n", b"")
+
+    def test_exec_shell_metacharacters(self, monkeypatch):
+        monkeypatch.setenv("HOME", "/home/test")
+        shell = LocalShell(requires_sudo=False)
+
+        assert _split_command("echo $HOME | tr a-z A-Z") is None
+        (status, out, _err) = shell.exec_capture("echo $HOME | tr a-z A-Z")
+        assert (status, out) == (0, b"/HOME/TEST\n")
+
+    def test_exec_builtin_falls_back_to_shell(self):
+        shell = LocalShell(requires_sudo=False)
+
+        (status, _out, _err) = shell.exec_capture("cd /tmp")
+        assert status == 0
+
+    def test_exec_missing_program(self):
+        shell = LocalShell(requires_sudo=False)
+
+        (status, _out, _err) = shell.exec_capture("no-such-program-shellutil")
+        assert status == 127
+
+    def test_exec_unbalanced_quote(self):
+        shell = LocalShell(requires_sudo=False)
+
+        assert _split_command('echo "abc') is None
+        (status, out, err) = shell.exec_capture('echo "abc')
+        assert status != 0
+        assert out == b""
+        assert err
+
+    def test_root_id_context(self, monkeypatch):
+        monkeypatch.setattr(os, "geteuid", lambda: 0)
+        shell = LocalShell()
+
+        assert shell._id_context() == id_parse("uid=0(root) gid=0(root) groups=0(root)")
+
+    def test_exec_many(self):
+        shell = LocalShell(requires_sudo=False)
+
+        res = shell.exec_many(["echo hello", "printf no-newline", "false"])
+        assert res == [(0, b"hello\n"), (0, b"no-newline"), (1, b"")]
+
+    def test_exec_many_empty(self):
+        shell = LocalShell(requires_sudo=False)
+
+        assert shell.exec_many([]) == []
+
+    def test_exec_many_exit(self):
+        shell = LocalShell(requires_sudo=False)
+
+        res = shell.exec_many(["echo a", "echo b >&2; echo c", "exit 3", "echo after"])
+        assert res == [(0, b"a\n"), (0, b"c\n"), (3, b""), (0, b"after\n")]
+
+    def test_exec_many_cd(self):
+        shell = LocalShell(requires_sudo=False)
+
+        res = shell.exec_many(["cd /", "pwd # comment"])
+        assert res == [(0, b""), (0, (os.getcwd() + "\n").encode())]
+
+    def test_exec_wait_before_read(self):
+        # Output larger than the pipe buffer must not block the exit status.
+        shell = LocalShell(requires_sudo=False)
+        (_stdin, stdout, _stderr) = shell.exec("head -c 1000000 /dev/zero")
+
+        assert stdout.wait_exit_status() == 0
+        assert stdout.exit_status_ready()
+        assert len(stdout.read()) == 1000000
+
+    def test_exec_stdout_and_stderr(self):
+        shell = LocalShell(requires_sudo=False)
+        (_stdin, stdout, stderr) = shell.exec("echo out; echo err >&2; exit 3")
+
+        assert stdout.read() == b"out\n"
+        assert stderr.read() == b"err\n"
+        assert stderr.wait_exit_status() == 3
+        assert stdout.exit_status_ready()
+
+    def test_interact_sees_environ_set_after_init(self, monkeypatch):
+        shell = LocalShell(requires_sudo=False)
+        monkeypatch.setenv("SHELLUTIL_TEST_VAR", "set-after-init")
+
+        interact = shell.interact(["sh", "-c", "echo $SHELLUTIL_TEST_VAR"])
+        assert interact.expect([EOF, "set-after-init"]) == 1
+
+    def test_mkdir_home(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("HOME", str(tmp_path))
+        monkeypatch.chdir(tmp_path)
+        shell = LocalShell(requires_sudo=False)
+
+        assert shell.mkdir("~/a b/$c") == 0
+        assert (tmp_path / "a b" / "$c").is_dir()
+        assert not (tmp_path / "~").exists()
+
+
+class TestMockShell:
+    def test_id_context_outside_chroot(self, monkeypatch):
+        # As a non-root user, a chroot just to run id would fail.
+        monkeypatch.setattr(os, "geteuid", lambda: 1000)
+        monkeypatch.setattr(LocalShell, "_id_ctx_cache", {})
+        shell = MockShell("/nonexistent-root")
+
+        assert shell._id_context() == LocalShell().id()
+
+    def test_exec_many_sudoes_the_chroot(self, monkeypatch):
+        spawned = []
+
+        def _spawn(run, command, **kwargs):
+            spawned.append(command)
+            out = f"x\n{shells.Shell._EXEC_MANY_SEP}0\n".encode()
+            return subprocess.CompletedProcess(command, 0, out, b"")
+
+        monkeypatch.setattr(shells, "_spawn", _spawn)
+        shell = MockShell("/nonexistent-root")
+        shell._id_ctx = id_parse("uid=1000(user) gid=1000(user) groups=1000(user)")
+
+        assert shell.exec_many(["stat x"]) == [(0, b"x")]
+        assert spawned[0].startswith("sudo chroot /nonexistent-root /bin/sh -c ")
+        assert "sudo stat" not in spawned[0]
+
+
+class TestRemoteShell:
+    def _connect_failing(self, monkeypatch, exc):
+        attempts = []
+
+        def _connect(self, hostname, username, password):
+            attempts.append(hostname)
+            raise exc
+
+        monkeypatch.setattr(WrappedSSHClient, "_connect", _connect)
+        monkeypatch.setattr(time, "sleep", lambda s: None)
+        return attempts
+
+    def test_auth_failure_not_retried(self, monkeypatch):
+        attempts = self._connect_failing(
+            monkeypatch, paramiko.AuthenticationException("denied")
+        )
+
+        assert RemoteShell.establish_connection("host", "user", "pw") is None
+        assert len(attempts) == 1
+
+    def test_transient_failure_retried(self, monkeypatch):
+        attempts = self._connect_failing(monkeypatch, ConnectionRefusedError())
+
+        assert RemoteShell.establish_connection("host", "user", "pw", retries=2) is None
+        assert len(attempts) == 3
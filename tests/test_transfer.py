@@ -0,0 +1,63 @@
+from abstractshell.transfer import RsyncCommand, RsyncProgress
+
+from test_line_iterator import MockInteraction
+
+
+class TestRsyncCommand:
+    def test_local_command(self):
+        cmd = RsyncCommand()
+        cmd.set_source("/src/")
+        cmd.set_destination("/dest/")
+        cmd.set_exclusions(["*.pyc", ".git"])
+
+        assert (
+            str(cmd)
+            == "rsync -az --no-human-readable --progress '--exclude=*.pyc' --exclude=.git /src/ /dest/"
+        )
+
+    def test_remote_command(self):
+        cmd = RsyncCommand()
+        cmd.set_source("/src/file")
+        cmd.set_destination("user@host:/dest/file")
+        cmd.set_remote_shell("ssh -oStrictHostKeyChecking=no")
+        cmd.set_remote_rsync("sudo rsync")
+        cmd.delete_remote_files(True)
+
+        assert str(cmd) == (
+            "rsync '--rsync-path=sudo rsync' -e 'ssh -oStrictHostKeyChecking=no' -az"
+            " --no-human-readable --progress --delete /src/file user@host:/dest/file"
+        )
+
+    def test_as_argv(self):
+        cmd = RsyncCommand()
+        cmd.set_source("/src/my file")
+        cmd.set_destination("user@host:/dest/")
+        cmd.set_remote_shell("ssh -i/keys/id")
+        cmd.set_exclusions(["*.pyc"])
+
+        assert cmd.as_argv() == [
+            "rsync",
+            "-e",
+            "ssh -i/keys/id",
+            "-az",
+            "--no-human-readable",
+            "--progress",
+            "--exclude=*.pyc",
+            "/src/my file",
+            "user@host:/dest/",
+        ]
+
+
+class TestRsyncProgress:
+    def test_multiple_without_summary(self):
+        total = 100
+        output = "sending incremental file list\r\n" + "".join(
+            f"file{k}\r\n"
+            f"          {k} 100%    1.00MB/s    0:00:00"
+            f" (xfer#{k}, to-check={total - k}/{total})\r\n"
+            for k in range(1, total + 1)
+        )
+        progress = RsyncProgress(MockInteraction(output), multiple=True)
+        progress.progress()
+
+        assert progress._progress_bar.n == total